@@ -1,14 +1,15 @@
 import os
 import json
+import asyncio
 import logging
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header
 from langchain.globals import set_debug
 from langchain_community.tools import TavilySearchResults
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
 
 from setting import get_config, config
@@ -51,10 +52,24 @@ if not logger.hasHandlers():
     logger.addHandler(file_handler)
 
 
-def tavily_search(song_title: str, artist_name: str) -> dict:
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    """
+    Computes the seconds left before a request deadline.
+
+    :param deadline: Deadline on the event loop clock, or None for no deadline.
+    :return: Seconds remaining (never negative), or None if there is no deadline.
+    """
+    if deadline is None:
+        return None
+    return max(0.0, deadline - asyncio.get_running_loop().time())
+
+
+async def tavily_search(song_title: str, artist_name: str) -> dict:
     """
     Finds YouTube and Spotify links for a given song title and artist using Tavily.
 
+    Both searches run concurrently and are cancelled together if the caller gives up.
+
     :param song_title: Title of the song to search for.
     :param artist_name: Name of the artist.
     :return: Dictionary containing YouTube and Spotify links.
@@ -75,12 +90,12 @@ def tavily_search(song_title: str, artist_name: str) -> dict:
     logger.debug(f"Constructed Spotify query: {spotify_query}")
 
     try:
-        # Execute the YouTube search
-        youtube_results = tavily_search_tool.run(youtube_query)
+        # Execute the YouTube and Spotify searches
+        youtube_results, spotify_results = await asyncio.gather(
+            tavily_search_tool.ainvoke(youtube_query),
+            tavily_search_tool.ainvoke(spotify_query),
+        )
         logger.debug(f"YouTube search results: {youtube_results}")
-
-        # Execute the Spotify search
-        spotify_results = tavily_search_tool.run(spotify_query)
         logger.debug(f"Spotify search results: {spotify_results}")
     except Exception as e:
         logger.error(f"Error during search execution: {e}")
@@ -116,26 +131,61 @@ def tavily_search(song_title: str, artist_name: str) -> dict:
         "youtube_link": youtube_link,
         "spotify_link": spotify_link
     }
-def enrich_song_links(songs: list) -> list:
+async def enrich_song_links(songs: list, deadline: Optional[float] = None) -> tuple:
     """
     Enriches each song in the list with YouTube and Spotify links.
 
+    Lookups run concurrently; any still running at the deadline are cancelled and their songs dropped.
+    Songs missing 'song_name' or 'artist', and songs whose lookup fails, are skipped.
+
     :param songs: List of songs with 'song_name' and 'artist' fields.
-    :return: List of songs updated with 'youtube_link' and 'spotify_link'.
+    :param deadline: Deadline on the event loop clock, or None to wait for every lookup.
+    :return: Tuple of the songs updated with 'youtube_link' and 'spotify_link',
+             and whether every lookup finished before the deadline.
     """
-    updated_songs = []
+    valid_songs = []
     for song in songs:
-        links = tavily_search(song['song_name'], song['artist'])
-
-        # Check if both YouTube and Spotify links are available
-        if links.get('youtube_link') and links.get('spotify_link'):
-            song.update(links)
-            updated_songs.append(song)
-            logger.debug(f"Added song: {song['song_name']} by {song['artist']}")
+        if isinstance(song, dict) and song.get('song_name') and song.get('artist'):
+            valid_songs.append(song)
         else:
-            logger.info(f"Skipping song '{song['song_name']}' by '{song['artist']}' due to missing links.")
+            logger.warning(f"Skipping song with missing 'song_name' or 'artist': {song}")
+
+    if not valid_songs:
+        return [], True
 
-    return updated_songs
+    lookups = [
+        asyncio.create_task(tavily_search(song['song_name'], song['artist']))
+        for song in valid_songs
+    ]
+    updated_songs = []
+    try:
+        done, pending = await asyncio.wait(lookups, timeout=remaining_time(deadline))
+
+        for song, lookup in zip(valid_songs, lookups):
+            if lookup not in done:
+                logger.warning(f"Link lookup for '{song['song_name']}' by '{song['artist']}' cancelled at deadline.")
+                continue
+
+            try:
+                links = lookup.result()
+            except Exception as e:
+                logger.error(f"Link lookup for '{song['song_name']}' by '{song['artist']}' failed: {e}")
+                continue
+
+            # Check if both YouTube and Spotify links are available
+            if links.get('youtube_link') and links.get('spotify_link'):
+                song.update(links)
+                updated_songs.append(song)
+                logger.debug(f"Added song: {song['song_name']} by {song['artist']}")
+            else:
+                logger.info(f"Skipping song '{song['song_name']}' by '{song['artist']}' due to missing links.")
+    finally:
+        # Never leave lookups running once this stage is over
+        for lookup in lookups:
+            if not lookup.done():
+                lookup.cancel()
+
+    return updated_songs, not pending
 
 # Define the song recommendation prompt
 song_recommendation_prompt = ChatPromptTemplate.from_template("""
@@ -157,26 +207,12 @@ def parse_llm_response(response: str) -> dict:
         logger.error(f"Failed to parse LLM response as JSON: {response}")
         return {"error": "Failed to generate song list"}
 
-def fetch_song_info(songs: list) -> list:
-    """
-    Fetches YouTube and Spotify links for each song in the list.
-
-    :param songs: List of songs with 'song_name' and 'artist' fields.
-    :return: List of songs enriched with 'youtube_link' and 'spotify_link'.
-    """
-    return enrich_song_links(songs)
-
-# Define the song recommendation chain
-song_recommendation_chain = (
-    RunnablePassthrough().assign(
-        songs=(
-            song_recommendation_prompt
-            | openai_chat_model
-            | StrOutputParser()
-            | parse_llm_response
-            | fetch_song_info
-        )
-    )
+# Define the song list chain (LLM suggestions without links)
+song_list_chain = (
+    song_recommendation_prompt
+    | openai_chat_model
+    | StrOutputParser()
+    | parse_llm_response
 )
 
 # Define the message formatting prompt
@@ -209,34 +245,107 @@ format_message_chain = (
     | parse_llm_response
 )
 
-format_message_chain = (
-    format_message_prompt
-    | openai_chat_model
-    | StrOutputParser()
-    | parse_llm_response
-)
-
-# Combine the recommendation and formatting chains
-combined_chain = song_recommendation_chain | format_message_chain
-
 # Define the request model
 class SongRequest(BaseModel):
     input: str
 
+
+def fallback_response(songs: list, partial: bool) -> dict:
+    """
+    Builds a response from linked songs without calling the formatting LLM.
+
+    Used when the deadline cuts the pipeline short or there is nothing left to format.
+    Songs are mapped onto the normal recommendation fields; details only the
+    formatting LLM provides (album, language, release_year) are set to None.
+
+    :param songs: Songs enriched with 'youtube_link' and 'spotify_link'.
+    :param partial: Whether the deadline cut the pipeline short.
+    :return: JSON object with a greeting, the recommendations, and the partial flag.
+    """
+    if partial:
+        greeting = "Here are the recommendations we could finish in time."
+    else:
+        greeting = "Sorry, we couldn't find any songs for that mood."
+
+    return {
+        "greeting": greeting,
+        "recommendations": [
+            {
+                "song_name": song.get("song_name"),
+                "artist": song.get("artist"),
+                "youtube_link": song.get("youtube_link"),
+                "spotify_link": song.get("spotify_link"),
+                "album": None,
+                "language": None,
+                "release_year": None
+            }
+            for song in songs
+        ],
+        "partial": partial
+    }
+
 @router.post("/process-song")
-async def process_song(request: SongRequest):
+async def process_song(
+    request: SongRequest,
+    x_request_timeout: Optional[float] = Header(default=None, gt=0),
+):
     """
     Endpoint to process song recommendations based on user input.
 
+    The request runs under a deadline taken from the X-Request-Timeout header (seconds),
+    or PROCESS_SONG_TIMEOUT_SECONDS if it is absent. Stages still running at the deadline
+    are cancelled and whatever recommendations completed are returned with "partial": true.
+    The song list, link lookups and message formatting run as separate stages rather than
+    one chain so that each stage can be bounded by the time left.
+    If the deadline passes before any recommendation completes, a 504 is returned.
+
     :param request: SongRequest containing the user's mood input.
-    :return: JSON object with a greeting and song recommendations.
+    :param x_request_timeout: Optional request timeout in seconds.
+    :return: JSON object with a greeting, song recommendations, and a partial flag.
     """
+    timeout = min(
+        x_request_timeout or config.PROCESS_SONG_TIMEOUT_SECONDS,
+        config.PROCESS_SONG_MAX_TIMEOUT_SECONDS
+    )
+    deadline = asyncio.get_running_loop().time() + timeout
+    logger.debug(f"Processing song request with a {timeout}s deadline")
+
     try:
-        # Prepare the input for the combined chain
+        # Prepare the input for the chains
         chain_input = {"input": request.input}
 
-        # Run the combined chain asynchronously
-        result = await combined_chain.ainvoke(chain_input)
+        # Ask the LLM for song suggestions
+        try:
+            songs = await asyncio.wait_for(
+                song_list_chain.ainvoke(chain_input), timeout=remaining_time(deadline)
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Deadline reached while generating the song list")
+            raise HTTPException(status_code=504, detail="Timed out before any recommendations completed")
+
+        if not isinstance(songs, list):
+            raise HTTPException(status_code=500, detail="Failed to generate song list")
+
+        # Look up links, keeping time back for the formatting stage
+        format_budget = min(config.PROCESS_SONG_FORMAT_BUDGET_SECONDS, remaining_time(deadline) / 2)
+        songs, complete = await enrich_song_links(songs, deadline - format_budget)
+
+        # Nothing left to format
+        if not songs:
+            if not complete:
+                logger.warning("Deadline reached before any link lookup completed")
+                raise HTTPException(status_code=504, detail="Timed out before any recommendations completed")
+            return fallback_response([], partial=False)
+
+        # Format the final message
+        try:
+            result = await asyncio.wait_for(
+                format_message_chain.ainvoke({**chain_input, "songs": songs}),
+                timeout=remaining_time(deadline)
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Deadline reached while formatting the response")
+            return fallback_response(songs, partial=True)
 
         # Log the response
         logger.info(f"Chain Response: {result}")
@@ -245,7 +354,10 @@ async def process_song(request: SongRequest):
         if "error" in result:
             raise HTTPException(status_code=500, detail=result["error"])
 
+        result["partial"] = not complete
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error: {e}")
         raise HTTPException(status_code=500, detail="An error occurred while processing your request")
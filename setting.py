@@ -18,6 +18,11 @@ class Settings(BaseSettings):
     MONGODB_CLUSTER: str
     MONGODB_DB: str
 
+    # /process-song Deadlines (seconds)
+    PROCESS_SONG_TIMEOUT_SECONDS: float = 30.0  # Used when no X-Request-Timeout header is sent
+    PROCESS_SONG_MAX_TIMEOUT_SECONDS: float = 120.0  # Upper bound for the X-Request-Timeout header
+    PROCESS_SONG_FORMAT_BUDGET_SECONDS: float = 8.0  # Time kept back for formatting the final message
+
     # Additional Settings (if any) can be added here
 
     # Root and Log Directories
@@ -0,0 +1,12 @@
+import os
+
+# Settings() requires these at import time; tests never reach the real services
+for name in (
+    "TAVILY_API_KEY",
+    "OPENAI_API_KEY",
+    "MONGODB_USER",
+    "MONGODB_PASSWORD",
+    "MONGODB_CLUSTER",
+    "MONGODB_DB",
+):
+    os.environ.setdefault(name, "test")
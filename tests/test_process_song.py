@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import processSongRouter
+
+
+SONGS = [
+    {"song_name": "Fast Song", "artist": "Quick Band", "mood_match": "upbeat"},
+    {"song_name": "Slow Song", "artist": "Late Band", "mood_match": "mellow"},
+]
+
+
+class FakeChain:
+    """Stands in for a LangChain chain, returning a fixed result after a delay."""
+
+    def __init__(self, result, delay=0.0):
+        self.result = result
+        self.delay = delay
+
+    async def ainvoke(self, chain_input):
+        await asyncio.sleep(self.delay)
+        return self.result
+
+
+def format_songs(songs):
+    return {
+        "greeting": "Hello!",
+        "recommendations": [
+            {**song, "album": "Album", "language": "English", "release_year": 2020}
+            for song in songs
+        ],
+    }
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(processSongRouter.router)
+    return TestClient(app)
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Patches tavily_search so 'Slow Song' never finishes, recording cancellations."""
+    state = {"cancelled": []}
+
+    async def fake_tavily_search(song_title, artist_name):
+        try:
+            if song_title == "Slow Song":
+                await asyncio.sleep(10)
+            return {
+                "youtube_link": f"https://youtube.com/watch?v={song_title}",
+                "spotify_link": f"https://open.spotify.com/track/{song_title}",
+            }
+        except asyncio.CancelledError:
+            state["cancelled"].append(song_title)
+            raise
+
+    monkeypatch.setattr(processSongRouter, "tavily_search", fake_tavily_search)
+    monkeypatch.setattr(processSongRouter, "song_list_chain", FakeChain([dict(song) for song in SONGS]))
+    monkeypatch.setattr(processSongRouter.config, "PROCESS_SONG_FORMAT_BUDGET_SECONDS", 0.1)
+    return state
+
+
+def test_enrich_song_links_cancels_pending_lookups(lookups):
+    async def run():
+        loop = asyncio.get_running_loop()
+        result = await processSongRouter.enrich_song_links(
+            [dict(song) for song in SONGS], loop.time() + 0.2
+        )
+        # Let the cancellation reach the fake lookup
+        await asyncio.sleep(0)
+        return result
+
+    songs, complete = asyncio.run(run())
+
+    assert [song["song_name"] for song in songs] == ["Fast Song"]
+    assert complete is False
+    assert lookups["cancelled"] == ["Slow Song"]
+
+
+def test_enrich_song_links_skips_bad_songs(monkeypatch):
+    async def failing_tavily_search(song_title, artist_name):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(processSongRouter, "tavily_search", failing_tavily_search)
+
+    songs, complete = asyncio.run(
+        processSongRouter.enrich_song_links([{"artist": "No Title"}, dict(SONGS[0])])
+    )
+
+    assert songs == []
+    assert complete is True
+
+
+def test_process_song_returns_partial_results_at_deadline(client, lookups, monkeypatch):
+    monkeypatch.setattr(processSongRouter, "format_message_chain", FakeChain(None, delay=10))
+
+    response = client.post("/process-song", json={"input": "happy"}, headers={"X-Request-Timeout": "0.5"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["partial"] is True
+    assert body["recommendations"] == [
+        {
+            "song_name": "Fast Song",
+            "artist": "Quick Band",
+            "youtube_link": "https://youtube.com/watch?v=Fast Song",
+            "spotify_link": "https://open.spotify.com/track/Fast Song",
+            "album": None,
+            "language": None,
+            "release_year": None,
+        }
+    ]
+    assert lookups["cancelled"] == ["Slow Song"]
+
+
+def test_process_song_full_run_is_not_partial(client, lookups, monkeypatch):
+    songs = [dict(SONGS[0])]
+    monkeypatch.setattr(processSongRouter, "song_list_chain", FakeChain(songs))
+    monkeypatch.setattr(processSongRouter, "format_message_chain", FakeChain(format_songs(songs)))
+
+    response = client.post("/process-song", json={"input": "happy"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["partial"] is False
+    assert body["recommendations"][0]["album"] == "Album"
+
+
+def test_process_song_times_out_before_any_recommendation(client, monkeypatch):
+    monkeypatch.setattr(processSongRouter, "song_list_chain", FakeChain([], delay=10))
+
+    response = client.post("/process-song", json={"input": "happy"}, headers={"X-Request-Timeout": "0.2"})
+
+    assert response.status_code == 504
+
+
+def test_process_song_caps_request_timeout(client, lookups, monkeypatch):
+    monkeypatch.setattr(processSongRouter.config, "PROCESS_SONG_MAX_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(processSongRouter, "format_message_chain", FakeChain(None, delay=10))
+
+    start = time.monotonic()
+    response = client.post("/process-song", json={"input": "happy"}, headers={"X-Request-Timeout": "60"})
+
+    assert time.monotonic() - start < 2
+    assert response.status_code == 200
+    assert response.json()["partial"] is True
+
+
+def test_process_song_rejects_non_positive_timeout(client):
+    response = client.post("/process-song", json={"input": "happy"}, headers={"X-Request-Timeout": "0"})
+
+    assert response.status_code == 422